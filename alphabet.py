@@ -0,0 +1,27 @@
+LETTERS = 'АБВГДЕЁЖЗИЙКЛМНОПРСТУФХЦЧШЩЪЫЬЭЮЯ'
+
+# Letters are encoded as small integers starting from 1, so an empty cell
+# of the field can be stored as 0 and words can be kept as `bytes`.
+EMPTY = 0
+CODES = range(1, len(LETTERS) + 1)
+
+_LETTER_CODES = {}
+for _code, _letter in zip(CODES, LETTERS):
+    _LETTER_CODES[_letter] = _code
+    _LETTER_CODES[_letter.lower()] = _code
+
+# Single letter words, to extend words without building a new tuple each time.
+SINGLE = [bytes((code, )) for code in range(len(LETTERS) + 1)]
+
+
+def encode(word):
+    return bytes(_LETTER_CODES[x] for x in word)
+
+
+def decode(codes):
+    return ''.join(LETTERS[x - 1] if x else ' ' for x in codes)
+
+
+def encode_field(rows):
+    return [bytearray(_LETTER_CODES[x] if x else EMPTY for x in row)
+            for row in rows]
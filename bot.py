@@ -1,39 +1,43 @@
+import heapq
 import logging
-import os
-import psutil
+import sys
 import time
 from collections import defaultdict
 from pprint import pprint
 
-from words.utils import execution_time_log
-from words.vocabulary import VocabularyAnswers, Vocabulary
+from words.alphabet import CODES, EMPTY, SINGLE, decode, encode_field
+from words.utils import execution_time_log, traced_memory_log
+from words.vocabulary import BloomVocabulary, VocabularyAnswers, Vocabulary
 
 logger = logging.getLogger(__name__)
 
 
-possible_letters = 'АБВГДЕЁЖЗИЙКЛМНОПРСТУФХЦЧШЩЪЫЬЭЮЯ'
-process = psutil.Process(os.getpid())
+# Approximate size of a cached route tuple, the letters and
+# the path are counted separately.
+_ROUTE_OVERHEAD = sys.getsizeof((None, None, None, None))
 
 
 class Wasserman:
 
+    vocabulary_class = Vocabulary
+
     def __init__(self, game):
         self._game = game
 
         self._vocabulary_checks = 0
-        self._longest_word = ''
+        self._longest_word = b''
         self._tested_routes = set()
 
     @execution_time_log('Wasserman guess next')
     def guess_next(self):
         self._vocabulary_checks = 0
-        self._longest_word = ''
+        self._longest_word = b''
         position = None
         chosen_letter = None
 
         for cell in self._get_possible_places():
-            for letter in possible_letters:
-                word = self._extend_search(letter, (cell,))
+            for letter in CODES:
+                word = self._extend_search(SINGLE[letter], (cell,))
                 if len(word) > len(self._longest_word):
                     self._longest_word = word
                     position = cell
@@ -58,12 +62,12 @@ class Wasserman:
         return places
 
     def _extend_search(self, letters, path, longest_lenght=0):
-        longest_word = ''
+        longest_word = b''
         for cell in self._get_neighbors(path[-1]):
             letter = self._game.field[cell[0]][cell[1]]
             if cell not in path and letter:
                 word = self._check_next_step(
-                    letters + letter,
+                    letters + SINGLE[letter],
                     path + (cell, ),
                     longest_lenght
                 )
@@ -73,7 +77,7 @@ class Wasserman:
             letter = self._game.field[cell[0]][cell[1]]
             if cell not in path and letter:
                 word = self._check_next_step(
-                    letter + letters,
+                    SINGLE[letter] + letters,
                     (cell,) + path,
                     longest_lenght
                 )
@@ -82,7 +86,7 @@ class Wasserman:
         return longest_word
 
     def _check_next_step(self, letters, path, longest_length=0):
-        longest_word = ''
+        longest_word = b''
         hit, potential = self._game.vocabulary.check(letters)
 
         self._vocabulary_checks += 1
@@ -90,7 +94,7 @@ class Wasserman:
         if VocabularyAnswers.COMPLETE_FORWARD in hit and letters not in self._game.used_words:
             longest_word = self._get_longest(longest_word, letters)
         elif VocabularyAnswers.COMPLETE_BACKWARD in hit:
-            backward = ''.join(reversed(letters))
+            backward = letters[::-1]
             if backward not in self._game.used_words:
                 longest_word = self._get_longest(longest_word, backward)
 
@@ -121,24 +125,45 @@ class Wasserman:
 
 class Druz:
 
-    def __init__(self, game):
+    vocabulary_class = BloomVocabulary
+
+    def __init__(self, game, bounded=False, candidates_per_cell=8, memory_budget=None):
         self._game = game
 
+        # Approximate size in bytes of cached routes and words. When it is
+        # exceeded routes of the least promising cells and letters are evicted.
+        self._memory_budget = memory_budget
+        self._cached_entries = 0
+        self._cached_size = 0
+
+        # Bounded mode prunes routes which can't give a word longer than
+        # the best one found so far and keeps only the longest words of
+        # each cell. Pruned routes and dropped words are kept in a heap by
+        # their potential and resumed when the best word becomes unavailable.
+        self._bounded = bounded
+        self._candidates_per_cell = candidates_per_cell if bounded else None
+        self._best_length = 0
+        self._pruned = []
+
         self._vocabulary_checks = 0
-        self._checked_starts = []
-        self._words = defaultdict(lambda: defaultdict(list))
+        self._checked_starts = set()
+        # Cell -> heap of (length, word, inserted letter, path)
+        self._words = defaultdict(list)
         self._known_letters = set()
         self._empty_border = defaultdict(lambda: defaultdict(list))
         self._just_visited = set()
         self._filled = set()
 
     @execution_time_log('Druz guess next')
+    @traced_memory_log('Druz guess next')
     def guess_next(self):
-        logger.debug(f'Memory usage: {process.memory_info().rss / 1000000}')
         self._vocabulary_checks = 0
 
         self._update_routes()
-        return self._get_longest_available()
+        logger.debug(f'Vocabulary checks: {self._vocabulary_checks}')
+        longest = self._get_longest_available()
+        self._check_memory_budget(longest)
+        return longest
 
     def _update_routes(self):
         t1 = time.perf_counter()
@@ -147,23 +172,57 @@ class Druz:
         t2 = time.perf_counter()
         self._update_existing_routes_with_new_letters()
         logger.debug(f'Existing routes time: {time.perf_counter() - t2}')
+        if self._bounded:
+            t3 = time.perf_counter()
+            self._resume_pruned_routes()
+            logger.debug(f'Pruned routes time: {time.perf_counter() - t3}')
 
     def _build_routes_for_new_cells(self):
         initial_cells = self._get_new_initial_cells()
 
-        to_remove = []
-        for cell in self._checked_starts:
-            if self.field[cell[0]][cell[1]] and cell in self._words:
-                del self._words[cell]
-
-        for cell in to_remove:
-            del self._checked_starts[cell]
+        # Words and routes of played cells can't be used anymore
+        filled_starts = {x for x in self._checked_starts if self.field[x[0]][x[1]]}
+        self._checked_starts -= filled_starts
+
+        for cell in filled_starts:
+            for _, word, _, path in self._words.pop(cell, []):
+                self._uncache(word, path)
+
+        if filled_starts:
+            for border in list(self._empty_border):
+                values = self._empty_border[border]
+                for cell in filled_starts & values.keys():
+                    for route in values.pop(cell):
+                        self._uncache(route[1], route[2])
+                if not values:
+                    del self._empty_border[border]
+
+        if self._bounded:
+            pruned = []
+            for route in self._pruned:
+                if self.field[route[2][0]][route[2][1]]:
+                    self._uncache(route[1], route[4])
+                else:
+                    pruned.append(route)
+            self._pruned = pruned
+            heapq.heapify(self._pruned)
+
+            for cell, candidates in self._words.items():
+                self._words[cell] = []
+                for candidate in candidates:
+                    if candidate[1] in self.used_words:
+                        self._uncache(candidate[1], candidate[3])
+                    else:
+                        self._words[cell].append(candidate)
+                heapq.heapify(self._words[cell])
+            longest = self._get_longest_available()
+            self._best_length = len(longest[2]) if longest else 0
 
         for cell in initial_cells:
-            self._checked_starts.append(cell)
-            for letter in possible_letters:
+            self._checked_starts.add(cell)
+            for letter in CODES:
                 self._just_visited = set()
-                self._build_route(cell, letter, letter, (cell,))
+                self._build_route(cell, letter, SINGLE[letter], (cell,))
 
     def _get_new_initial_cells(self):
         filled = set()
@@ -181,46 +240,58 @@ class Druz:
 
     def _build_route(self, initial_cell, insert_letter, letters, path):
         self._just_visited.add(frozenset(path))
-        hit = self._check_vocabulary(letters)
+        hit, potential = self._check_vocabulary(letters)
 
         if initial_cell == (1, 1):
             a = 1
 
         if VocabularyAnswers.COMPLETE_FORWARD in hit:
-            self._words[initial_cell][insert_letter].append((letters, path))
+            self._add_word(initial_cell, insert_letter, letters, path)
         if VocabularyAnswers.COMPLETE_BACKWARD in hit:
-            self._words[initial_cell][insert_letter].append((backward(letters), path))
+            self._add_word(initial_cell, insert_letter, backward(letters), path)
 
         if VocabularyAnswers.PART in hit:
-            for cell in self._get_neighbors(path[-1]):
-                letter = self.field[cell[0]][cell[1]]
-                if cell not in path:
-                    if not letter:
-                        self._empty_border[cell][initial_cell].append((insert_letter, letters, path))
-                    else:
-                        word = letters + letter
-                        next_path = path + (cell,)
-                        if frozenset(next_path) not in self._just_visited:
-                            self._build_route(initial_cell, insert_letter, word, next_path)
-
-            for cell in self._get_neighbors(path[0]):
-                letter = self.field[cell[0]][cell[1]]
-                if cell not in path:
-                    if not letter:
-                        self._empty_border[cell][initial_cell].append((insert_letter, letters, path))
-                    else:
-                        word = letter + letters
-                        next_path = (cell,) + path
-                        if frozenset(next_path) not in self._just_visited:
-                            self._build_route(initial_cell, insert_letter, word, next_path)
+            if self._bounded and potential is not None and potential <= self._best_length:
+                heapq.heappush(
+                    self._pruned,
+                    (-potential, letters, initial_cell, insert_letter, path, False)
+                )
+                self._cache(letters, path)
+            else:
+                self._extend_route(initial_cell, insert_letter, letters, path, potential)
+
+    def _extend_route(self, initial_cell, insert_letter, letters, path, potential):
+        for cell in self._get_neighbors(path[-1]):
+            letter = self.field[cell[0]][cell[1]]
+            if cell not in path:
+                if not letter:
+                    self._empty_border[cell][initial_cell].append((insert_letter, letters, path, potential))
+                    self._cache(letters, path)
+                else:
+                    word = letters + SINGLE[letter]
+                    next_path = path + (cell,)
+                    if frozenset(next_path) not in self._just_visited:
+                        self._build_route(initial_cell, insert_letter, word, next_path)
+
+        for cell in self._get_neighbors(path[0]):
+            letter = self.field[cell[0]][cell[1]]
+            if cell not in path:
+                if not letter:
+                    self._empty_border[cell][initial_cell].append((insert_letter, letters, path, potential))
+                    self._cache(letters, path)
+                else:
+                    word = SINGLE[letter] + letters
+                    next_path = (cell,) + path
+                    if frozenset(next_path) not in self._just_visited:
+                        self._build_route(initial_cell, insert_letter, word, next_path)
 
     def _update_existing_routes_with_new_letters(self):
         i = 0
         to_remove = []
-        for border, values in self._empty_border.items():
+        for border, values in list(self._empty_border.items()):
             if self.field[border[0]][border[1]]:
                 for initial_cell, routes in values.items():
-                    letter = ''
+                    letter = None
                     for route in routes:
                         if not self.field[initial_cell[0]][initial_cell[1]]:
                             i += 1
@@ -238,14 +309,14 @@ class Druz:
                                 self._build_route(
                                     initial_cell,
                                     route[0],
-                                    self.field[border[0]][border[1]] + route[1],
+                                    SINGLE[self.field[border[0]][border[1]]] + route[1],
                                     (border, ) + route[2]
                                 )
                             else:
                                 self._build_route(
                                     initial_cell,
                                     route[0],
-                                    route[1] + self.field[border[0]][border[1]],
+                                    route[1] + SINGLE[self.field[border[0]][border[1]]],
                                     route[2] + (border, )
                                 )
                 to_remove.append(border)
@@ -253,19 +324,175 @@ class Druz:
         logger.debug(f'Existing routes rechecks: {i}')
 
         for cell in to_remove:
+            for routes in self._empty_border[cell].values():
+                for route in routes:
+                    self._uncache(route[1], route[2])
             del self._empty_border[cell]
 
+    def _resume_pruned_routes(self):
+        i = 0
+        while self._pruned and -self._pruned[0][0] > self._best_length:
+            potential, letters, initial_cell, insert_letter, path, complete = \
+                heapq.heappop(self._pruned)
+            self._uncache(letters, path)
+            if not self.field[initial_cell[0]][initial_cell[1]]:
+                i += 1
+                if complete:
+                    self._add_word(initial_cell, insert_letter, letters, path)
+                else:
+                    self._just_visited = {frozenset(path)}
+                    self._extend_route(initial_cell, insert_letter, letters, path, -potential)
+
+        logger.debug(f'Pruned routes resumed: {i}, left: {len(self._pruned)}')
+
+    def _check_memory_budget(self, longest):
+        logger.debug(
+            f'Cached entries: {self._cached_entries}, '
+            f'approximate size: {self._cached_size}'
+        )
+        if self._memory_budget is None or self._cached_size <= self._memory_budget:
+            return
+
+        # Groups holding available words are evicted only after the ones
+        # holding just routes, as potentials are far longer than real words.
+        # The group of the chosen move is never evicted.
+        groups = self._get_cached_groups()
+        if longest:
+            groups.pop((longest[0], longest[1]), None)
+
+        size = self._cached_size
+        evicted = set()
+        for key in sorted(groups, key=lambda x: groups[x][:3]):
+            if size <= self._memory_budget:
+                break
+            evicted.add(key)
+            size -= groups[key][3]
+
+        self._evict(evicted)
+        logger.debug(
+            f'Evicted cells and letters: {len(evicted)}. '
+            f'Cached entries: {self._cached_entries}, '
+            f'approximate size: {self._cached_size}'
+        )
+
+    def _get_cached_groups(self):
+        # (initial cell, inserted letter) ->
+        #     [has available words, score, longest route, approximate size],
+        # where score is the longest available word or the longest potential
+        # of routes, which can't be longer than the field.
+        groups = defaultdict(lambda: [False, 0, 0, 0])
+        cells = len(self.field) * len(self.field[0])
+
+        def account(initial_cell, insert_letter, letters, path, word=None, potential=None):
+            group = groups[(initial_cell, insert_letter)]
+            if not self.field[initial_cell[0]][initial_cell[1]]:
+                if word and word not in self.used_words:
+                    if not group[0]:
+                        group[0], group[1] = True, 0
+                    group[1] = max(group[1], len(word))
+                elif not group[0]:
+                    group[1] = max(group[1], min(potential or len(letters), cells))
+                    group[2] = max(group[2], len(letters))
+            group[3] += _route_size(letters, path)
+
+        for cell, candidates in self._words.items():
+            for _, word, letter, path in candidates:
+                account(cell, letter, word, path, word=word)
+
+        for values in self._empty_border.values():
+            for initial_cell, routes in values.items():
+                for letter, letters, path, potential in routes:
+                    account(initial_cell, letter, letters, path, potential=potential)
+
+        for potential, letters, initial_cell, letter, path, complete in self._pruned:
+            if complete:
+                account(initial_cell, letter, letters, path, word=letters)
+            else:
+                account(initial_cell, letter, letters, path, potential=-potential)
+
+        return groups
+
+    def _evict(self, evicted):
+        for cell in list(self._words):
+            candidates = []
+            for candidate in self._words[cell]:
+                if (cell, candidate[2]) in evicted:
+                    self._uncache(candidate[1], candidate[3])
+                else:
+                    candidates.append(candidate)
+            heapq.heapify(candidates)
+            if candidates:
+                self._words[cell] = candidates
+            else:
+                del self._words[cell]
+
+        for border in list(self._empty_border):
+            values = self._empty_border[border]
+            for initial_cell in list(values):
+                routes = []
+                for route in values[initial_cell]:
+                    if (initial_cell, route[0]) in evicted:
+                        self._uncache(route[1], route[2])
+                    else:
+                        routes.append(route)
+                if routes:
+                    values[initial_cell] = routes
+                else:
+                    del values[initial_cell]
+            if not values:
+                del self._empty_border[border]
+
+        pruned = []
+        for route in self._pruned:
+            if (route[2], route[3]) in evicted:
+                self._uncache(route[1], route[4])
+            else:
+                pruned.append(route)
+        self._pruned = pruned
+        heapq.heapify(self._pruned)
+
+    def _cache(self, letters, path):
+        self._cached_entries += 1
+        self._cached_size += _route_size(letters, path)
+
+    def _uncache(self, letters, path):
+        self._cached_entries -= 1
+        self._cached_size -= _route_size(letters, path)
+
+    def _add_word(self, initial_cell, insert_letter, word, path):
+        if word in self.used_words:
+            return
+
+        self._best_length = max(self._best_length, len(word))
+        candidates = self._words[initial_cell]
+        candidate = (len(word), word, insert_letter, path)
+        if self._candidates_per_cell is None:
+            heapq.heappush(candidates, candidate)
+            self._cache(word, path)
+        elif any(x[1] == word for x in candidates):
+            return
+        elif len(candidates) < self._candidates_per_cell:
+            heapq.heappush(candidates, candidate)
+            self._cache(word, path)
+        else:
+            # The dropped word is kept as a pruned route to be
+            # restored when longer words of the cell are used.
+            length, word, insert_letter, path = heapq.heappushpop(candidates, candidate)
+            heapq.heappush(
+                self._pruned,
+                (-length, word, initial_cell, insert_letter, path, True)
+            )
+            self._cache(candidate[1], candidate[3])
+
     def _get_longest_available(self):
-        longest = [None, '', '']
-        for cell in self._words:
-            for letter in self._words[cell]:
-                for word in self._words[cell][letter]:
-                    if word[0] not in self.used_words \
-                            and len(word[1]) > len(longest[2]):
-                        longest = (cell, letter, word[0])
+        longest = None
+        for cell, candidates in self._words.items():
+            for length, word, letter, _ in candidates:
+                if word not in self.used_words \
+                        and (not longest or length > len(longest[2])):
+                    longest = (cell, letter, word)
 
-        if longest[0]:
-            return longest
+        return longest
 
     def _get_neighbors(self, cell):
         if cell[1] < len(self.field[0]) - 1:
@@ -278,9 +505,9 @@ class Druz:
             yield (cell[0] - 1, cell[1])
 
     def _check_vocabulary(self, word):
-        hit = self._game.vocabulary.check(word)
+        answer = self._game.vocabulary.check(word)
         self._vocabulary_checks += 1
-        return hit
+        return answer
     
     @property
     def field(self):
@@ -291,6 +518,103 @@ class Druz:
         return self._game.used_words
 
 
+class Potashev:
+
+    # The trie is built on the first move and takes about 58 MB
+    # in addition to the vocabulary parts.
+    vocabulary_class = Vocabulary
+
+    def __init__(self, game):
+        self._game = game
+
+        self._trie_steps = 0
+        self._longest = None
+
+    @execution_time_log('Potashev guess next')
+    def guess_next(self):
+        self._trie_steps = 0
+        self._longest = None
+        trie = getattr(self.vocabulary, 'trie', None)
+        if trie is None:
+            raise TypeError(
+                f'Potashev needs a vocabulary with a trie, '
+                f'got {type(self.vocabulary).__name__}'
+            )
+
+        # Every path on the field is walked together with the vocabulary trie
+        # from its first cell. Reversed words are found from the other end
+        # of the same path. Exactly one empty cell is allowed in a path and
+        # only letters having a trie edge are tried there.
+        for i in range(len(self.field)):
+            for j in range(len(self.field[0])):
+                cell = (i, j)
+                letter = self.field[i][j]
+                if letter:
+                    if letter in trie:
+                        self._walk(cell, trie[letter], bytearray((letter, )), {cell}, None)
+                elif self._is_border(cell):
+                    for letter, node in trie.items():
+                        if letter:
+                            self._walk(cell, node, bytearray((letter, )), {cell}, (cell, letter))
+
+        logger.debug(f'Trie steps: {self._trie_steps}')
+        return self._longest
+
+    def _walk(self, cell, node, word, visited, anchor):
+        self._trie_steps += 1
+
+        if EMPTY in node and anchor \
+                and (not self._longest or len(word) > len(self._longest[2])):
+            found = bytes(word)
+            if found not in self.used_words:
+                self._longest = (anchor[0], anchor[1], found)
+
+        for next_cell in self._get_neighbors(cell):
+            if next_cell in visited:
+                continue
+
+            letter = self.field[next_cell[0]][next_cell[1]]
+            if letter:
+                if letter in node:
+                    self._step(next_cell, node[letter], letter, word, visited, anchor)
+            elif not anchor:
+                for letter, child in node.items():
+                    if letter:
+                        self._step(next_cell, child, letter, word, visited, (next_cell, letter))
+
+    def _step(self, cell, node, letter, word, visited, anchor):
+        word.append(letter)
+        visited.add(cell)
+        self._walk(cell, node, word, visited, anchor)
+        visited.remove(cell)
+        word.pop()
+
+    def _is_border(self, cell):
+        return any(self.field[x[0]][x[1]] for x in self._get_neighbors(cell))
+
+    def _get_neighbors(self, cell):
+        if cell[1] < len(self.field[0]) - 1:
+            yield (cell[0], cell[1] + 1)
+        if cell[1] > 0:
+            yield (cell[0], cell[1] - 1)
+        if cell[0] < len(self.field) -1:
+            yield (cell[0] + 1, cell[1])
+        if cell[0] > 0:
+            yield (cell[0] - 1, cell[1])
+
+    @property
+    def vocabulary(self):
+        return self._game.vocabulary
+
+    @property
+    def field(self):
+        return self._game.field
+
+    @property
+    def used_words(self):
+        return self._game.used_words
+
+
 def longest(a, b):
     if len(a) > len(b):
         return a
@@ -299,7 +623,11 @@ def longest(a, b):
 
 
 def backward(word):
-    return ''.join(reversed(word))
+    return word[::-1]
+
+
+def _route_size(letters, path):
+    return _ROUTE_OVERHEAD + sys.getsizeof(letters) + sys.getsizeof(path)
 
 
 if __name__ == '__main__':
@@ -312,38 +640,81 @@ if __name__ == '__main__':
 
     class TestDruz(Druz):
 
-        def __init__(self):
-            self.test_vocabulary = Vocabulary()
-            super().__init__(None)
+        test_vocabulary = Vocabulary()
+
+        def __init__(self, **kwargs):
+            super().__init__(None, **kwargs)
 
         def _check_vocabulary(self, word):
-            hit, potential = self.test_vocabulary.check(word)
+            answer = self.test_vocabulary.check(word)
             self._vocabulary_checks += 1
-            return hit
+            return answer
 
-        field = [
+        field = encode_field([
             ['С', '',  ''],
             ['Л', '',  ''],
             ['',  'В', ''],
-        ]
+        ])
+
+        used_words = set()
+
+    def print_guess(guess):
+        if guess:
+            cell, letter, word = guess
+            print(cell, decode((letter, )), decode(word))
+        else:
+            print(guess)
+
+    def print_border(border):
+        pprint({
+            cell: {
+                initial_cell: [(decode((x[0], )), decode(x[1]), x[2], x[3]) for x in routes]
+                for initial_cell, routes in values.items()
+            }
+            for cell, values in border.items()
+        })
+
+    class TestPotashev(Potashev):
+
+        vocabulary = TestDruz.test_vocabulary
+
+        def __init__(self):
+            super().__init__(None)
+
+        field = TestDruz.field
 
         used_words = set()
 
     player = TestDruz()
+    trie_player = TestPotashev()
+    # The budget is far less than the whole cache,
+    # but covers the groups of the best words of both moves.
+    budgeted_player = TestDruz(bounded=True, memory_budget=20000)
 
-    print(player.guess_next())
+    print_guess(player.guess_next())
+    budgeted_guess = budgeted_player.guess_next()
+    print_guess(budgeted_guess)
 
-    pprint(player._empty_border)
+    print_border(player._empty_border)
 
-    player.field = [
+    player.field = budgeted_player.field = trie_player.field = encode_field([
             ['С', '',  ''],
             ['Л', '',  ''],
             ['',  'В', 'О'],
-        ]
-
-    print(player.guess_next())
-
-    pprint(player._empty_border)
+        ])
+
+    guess = player.guess_next()
+    print_guess(guess)
+    budgeted_guess = budgeted_player.guess_next()
+    print_guess(budgeted_guess)
+    assert len(budgeted_guess[2]) == len(guess[2])
+    # Druz skips routes through the same cells in another order,
+    # so it can miss words which Potashev finds.
+    trie_guess = trie_player.guess_next()
+    print_guess(trie_guess)
+    assert len(trie_guess[2]) >= len(guess[2])
+
+    print_border(player._empty_border)
 
     # logger.debug(f'Vocabulary checks: {player._vocabulary_checks}')
 
@@ -1,9 +1,11 @@
 import logging
+import sys
+import tracemalloc
 from enum import Enum
 
 import words.bot
+from words.alphabet import decode, encode
 from words.human import Human
-from words.vocabulary import BloomVocabulary
 
 
 logger = logging.getLogger('words')
@@ -16,29 +18,31 @@ class PlayerType(Enum):
 
 class Game:
 
-    def __init__(self, N, M, humans, bots, word=None):
+    def __init__(self, N, M, humans, bots, word=None, engine=words.bot.Druz,
+                 memory_budget=None):
         self._N = N
         self._M = M
 
         self.used_words = set()
 
-        self.vocabulary = BloomVocabulary()
+        self._engine = engine
+        self._memory_budget = memory_budget
+        self.vocabulary = engine.vocabulary_class()
 
-        self._initial_word = word
+        self._initial_word = encode(word) if word else None
         self.field = self._init_field()
         self._free_cells = (N - 1) * M
         self._players = self._init_players(humans, bots)
 
     def _init_field(self):
-        field = [['' for _ in range(self._N)]
-                           for _ in range(self._M)]
+        field = [bytearray(self._N) for _ in range(self._M)]
 
         if self._initial_word and len(self._initial_word) == self._M:
-            field[self._N // 2] = list(self._initial_word)
+            field[self._N // 2] = bytearray(self._initial_word)
             self.used_words.add(self._initial_word)
         else:
             word = self.vocabulary.get_word(self._M)
-            field[self._N // 2] = list(word)
+            field[self._N // 2] = bytearray(word)
             self.used_words.add(word)
 
         return field
@@ -51,9 +55,13 @@ class Game:
                 players.append(Player(Human(self), f'Player_{i}'))
                 i += 1
 
+        engine_options = {}
+        if self._memory_budget is not None:
+            engine_options['memory_budget'] = self._memory_budget
+
         if type(bots) == int:
             for _ in range(bots):
-                players.append(Player(words.bot.Druz(self), f'Player_{i}'))
+                players.append(Player(self._engine(self, **engine_options), f'Player_{i}'))
                 i += 1
 
         return players
@@ -75,7 +83,7 @@ class Game:
                     player._score += len(word)
                     passes = 0
 
-                    print(word)
+                    print(decode(word))
                     print(self)
 
             if self._free_cells < len(self._players):
@@ -91,8 +99,8 @@ class Game:
         score += '\n'.join([str(x) for x in self._players])
 
         field = ''
-        for row in game.field:
-            field += '|'.join([f" {x or ' '} " for x in row]) + '\n'
+        for row in self.field:
+            field += '|'.join([f" {x} " for x in decode(row)]) + '\n'
             field += '+'.join(['---' for _ in row]) + '\n'
         return score + '\n\n' + field
 
@@ -119,5 +127,10 @@ if __name__ == '__main__':
     ch.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
     logger.addHandler(ch)
 
-    game = Game(10, 10, 0, 3, 'АБВГДЕЖЗИК')
+    # Per move memory of the bots is logged only while tracing,
+    # as tracing slows the game down.
+    if '--trace-memory' in sys.argv:
+        tracemalloc.start()
+
+    game = Game(10, 10, 0, 3, 'АБВГДЕЖЗИК', memory_budget=2_000_000)
     game.run()
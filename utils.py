@@ -1,5 +1,6 @@
 import logging
 import time
+import tracemalloc
 from functools import wraps
 
 logger = logging.getLogger(__name__)
@@ -19,6 +20,29 @@ def execution_time_log(description):
     return decorator
 
 
+def traced_memory_log(description):
+    # Works only when tracing is started with `tracemalloc.start()`,
+    # as tracing slows the whole program down.
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not tracemalloc.is_tracing():
+                return func(*args, **kwargs)
+
+            tracemalloc.reset_peak()
+            before, _ = tracemalloc.get_traced_memory()
+            result = func(*args, **kwargs)
+            current, peak = tracemalloc.get_traced_memory()
+            logger.debug(
+                f'{description}. Memory: {current}, '
+                f'change: {current - before}, peak: {peak}'
+            )
+            return result
+
+        return wrapper
+    return decorator
+
+
 def change_encoding():
     file = 'Полная парадигма. Морфология.txt'
     with open(file, encoding='cp1251') as fp:
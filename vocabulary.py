@@ -9,6 +9,7 @@ from pathlib import Path
 
 from bloom_filter import BloomFilter
 
+from words.alphabet import EMPTY, encode
 from words.utils import execution_time_log
 
 
@@ -24,42 +25,66 @@ class VocabularyAnswers(Flag):
 
 _RAW_WORDS_PATH = Path(__file__).parent / 'words.txt'
 _VOCABULARY_PATH = Path(__file__).parent / 'words.pkl'
+_DISK_VOCABULARY_PATH = Path(__file__).parent / 'words_disk.pkl'
+_BLOOM_VOCABULARY_PATH = Path(__file__).parent / 'words_bloom.pkl'
+
+
+def _read_words():
+    for word in open(_RAW_WORDS_PATH):
+        word = word.strip()
+        if word:
+            yield encode(word)
+
+
+def build_trie(words):
+    # Nodes are dicts from letter codes to child nodes,
+    # the EMPTY key marks the end of a word.
+    trie = {}
+    for word in words:
+        node = trie
+        for letter in word:
+            node = node.setdefault(letter, {})
+        node[EMPTY] = True
+    return trie
 
 
 class Vocabulary:
 
     @execution_time_log('Init vocabulary')
     def __init__(self):
+        self._trie = None
         try:
-            self._words, self._parts = pickle.load(_VOCABULARY_PATH.open('rb'))
+            self._words, self._reversed_words, self._parts = \
+                pickle.load(_VOCABULARY_PATH.open('rb'))
         except Exception:
             logger.warning('Vocabulary unpickling error: \n' + traceback.format_exc())
             self._build_from_file()
-            pickle.dump((self._words, self._parts), _VOCABULARY_PATH.open('wb'))
+            pickle.dump(
+                (self._words, self._reversed_words, self._parts),
+                _VOCABULARY_PATH.open('wb')
+            )
 
     def _build_from_file(self):
-        self._words = set()
-        for word in open(_RAW_WORDS_PATH):
-            self._words.add(word.strip().upper())
-            # self._words.add(bytes([ord(x) - 1040 for x in word.strip().upper()]))
+        self._words = set(_read_words())
+        self._reversed_words = {word[::-1] for word in self._words}
 
-        self._parts = defaultdict(int)
+        parts = defaultdict(int)
         for word in self._words:
             for i in range(1, len(word)):
                 for j in range(len(word) - i + 1):
                     part = word[j: j+i]
-                    self._parts[part] = max(self._parts[part], len(word))
-                    rev = ''.join(reversed(part))
-                    self._parts[rev] = max(self._parts[rev], len(word))
+                    parts[part] = max(parts[part], len(word))
+                    rev = part[::-1]
+                    parts[rev] = max(parts[rev], len(word))
+        self._parts = dict(parts)
 
     # @execution_time_log('Vocabulary check')
     def check(self, checking_word):
         result = VocabularyAnswers.MISSING
-        reversed_word = ''.join(reversed(checking_word))
 
         if checking_word in self._words:
             result |= VocabularyAnswers.COMPLETE_FORWARD
-        if reversed_word in self._words:
+        if checking_word in self._reversed_words:
             result |= VocabularyAnswers.COMPLETE_BACKWARD
 
         potential = None
@@ -70,6 +95,12 @@ class Vocabulary:
 
         return result, potential
 
+    @property
+    def trie(self):
+        if self._trie is None:
+            self._trie = build_trie(self._words)
+        return self._trie
+
     def get_word(self, length):
         words = []
         for word in self._words:
@@ -84,45 +115,45 @@ class DiskVocabulary:
     @execution_time_log('Init vocabulary')
     def __init__(self):
         try:
-            self._words, self._parts = pickle.load(_VOCABULARY_PATH.open('rb'))
+            self._words, self._reversed_words, self._parts = \
+                pickle.load(_DISK_VOCABULARY_PATH.open('rb'))
             raise Exception()
         except Exception:
             logger.warning('Vocabulary unpickling error: \n' + traceback.format_exc())
             self._build_from_file()
-            pickle.dump((self._words, self._parts), _VOCABULARY_PATH.open('wb'))
+            pickle.dump(
+                (self._words, self._reversed_words, self._parts),
+                _DISK_VOCABULARY_PATH.open('wb')
+            )
 
     def _build_from_file(self):
         self._words = set()
+        self._reversed_words = set()
         self._parts = set()
 
-        for word in open(_RAW_WORDS_PATH):
-            word = word.strip().upper()
-            # self._words.add(word.strip().upper())
-            self._words.add(sum([34 ** i * (ord(x) - 1039) for i, x in enumerate(word)]))
+        for word in _read_words():
+            self._words.add(word)
+            self._reversed_words.add(word[::-1])
 
             for i in range(1, len(word)):
                 for j in range(len(word) - i + 1):
-                    part = word[j: j+i]
-                    self._parts.add(sum([34 ** i * (ord(x) - 1039) for i, x in enumerate(part)]))
+                    self._parts.add(word[j: j+i])
 
 
     # @execution_time_log('Vocabulary check')
     def check(self, checking_word):
-        reversed_word = ''.join(reversed(checking_word))
-        checking_word = sum([34 ** i * (ord(x) - 1039) for i, x in enumerate(checking_word)])
         result = VocabularyAnswers.MISSING
-        reversed_word = sum([34 ** i * (ord(x) - 1039) for i, x in enumerate(reversed_word)])
 
         if checking_word in self._words:
             result |= VocabularyAnswers.COMPLETE_FORWARD
-        if reversed_word in self._words:
+        if checking_word in self._reversed_words:
             result |= VocabularyAnswers.COMPLETE_BACKWARD
 
         if checking_word in self._parts:
             # logger.debug(f'Part: {checking_word}')
             result |= VocabularyAnswers.PART
 
-        return result
+        return result, None
 
     def get_word(self, length):
         words = []
@@ -138,38 +169,41 @@ class BloomVocabulary:
     @execution_time_log('Init vocabulary')
     def __init__(self):
         self.words_bloom = BloomFilter(max_elements=64_000, error_rate=0.000001)
+        self.reversed_words_bloom = BloomFilter(max_elements=64_000, error_rate=0.000001)
         self.parts_bloom = BloomFilter(max_elements=700_000, error_rate=0.000001)
 
         try:
-            self.words_bloom, self.parts_bloom = pickle.load(_VOCABULARY_PATH.open('rb'))
+            self.words_bloom, self.reversed_words_bloom, self.parts_bloom = \
+                pickle.load(_BLOOM_VOCABULARY_PATH.open('rb'))
         except Exception:
             logger.warning('Vocabulary unpickling error: \n' + traceback.format_exc())
             self._build_from_file()
-            pickle.dump((self.words_bloom, self.parts_bloom), _VOCABULARY_PATH.open('wb'))
+            pickle.dump(
+                (self.words_bloom, self.reversed_words_bloom, self.parts_bloom),
+                _BLOOM_VOCABULARY_PATH.open('wb')
+            )
 
     def _build_from_file(self):
-        for word in open(_RAW_WORDS_PATH):
-            word = word.strip().upper()
-            self.words_bloom.add(word.strip().upper())
+        for word in _read_words():
+            self.words_bloom.add(word)
+            self.reversed_words_bloom.add(word[::-1])
 
             for i in range(1, len(word)):
                 for j in range(len(word) - i + 1):
-                    part = word[j: j+i]
-                    self.parts_bloom.add(part.strip().upper())
+                    self.parts_bloom.add(word[j: j+i])
 
     # @execution_time_log('Vocabulary check')
     def check(self, checking_word):
-        reversed_word = ''.join(reversed(checking_word))
         result = VocabularyAnswers.MISSING
 
-        if checking_word.upper() in self.words_bloom:
+        if checking_word in self.words_bloom:
             result |= VocabularyAnswers.COMPLETE_FORWARD
-        if reversed_word.upper() in self.words_bloom:
+        if checking_word in self.reversed_words_bloom:
             result |= VocabularyAnswers.COMPLETE_BACKWARD
-        if checking_word.upper() in self.parts_bloom:
+        if checking_word in self.parts_bloom:
             result |= VocabularyAnswers.PART
 
-        return result
+        return result, None
 
 
 if __name__ == '__main__':
@@ -193,11 +227,11 @@ if __name__ == '__main__':
     # from pprint import pprint
     # pprint(vocabulary._parts)
 
-    print(vocabulary.check('ТЮЛЕН'))
-    print(vocabulary.check('БАРА'))
-    print(vocabulary.check('СЛОВО'))
-    print(vocabulary.check('ЛЮ'))
-    print(vocabulary.check('ОРОТАВАКСКЭВ'))
+    print(vocabulary.check(encode('ТЮЛЕН')))
+    print(vocabulary.check(encode('БАРА')))
+    print(vocabulary.check(encode('СЛОВО')))
+    print(vocabulary.check(encode('ЛЮ')))
+    print(vocabulary.check(encode('ОРОТАВАКСКЭВ')))
 
     print(f'Memory usage: {process.memory_info().rss / 1000000:,}')
 